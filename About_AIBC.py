@@ -1,5 +1,6 @@
+import hashlib
 import streamlit as st
-import google.generativeai as genai
+from helper_functions.utility import get_genai
 
 # region <--------- Streamlit App Configuration --------->
 st.set_page_config(
@@ -8,6 +9,17 @@ st.set_page_config(
 )
 # endregion <--------- Streamlit App Configuration --------->
 
+MODEL_OPTIONS = {
+    "gemini-2.5-flash-lite": "2.5 Flash Lite (lowest cost, newest)",
+    "gemini-2.0-flash-lite": "2.0 Flash Lite (very low cost)",
+    "gemini-2.0-flash-exp": "2.0 Flash Experimental (may vary)",
+}
+
+@st.cache_resource(show_spinner=False)
+def get_model(api_key_fingerprint: str, name: str):
+    """Shared GenerativeModel per (key, model); the fingerprint keeps the raw key out of the cache"""
+    return get_genai().GenerativeModel(name)
+
 # Session state initialization
 for key, default in {
     'gemini_initialized': False,
@@ -20,31 +32,27 @@ for key, default in {
 with st.sidebar:
     st.header("⚙️ Model & API Setup")
     google_api_key = st.text_input("Google API Key", type="password", help="Enter your Google Gemini API key")
-
-    model_options = {
-        "gemini-2.5-flash-lite": "2.5 Flash Lite (lowest cost, newest)",
-        "gemini-2.0-flash-lite": "2.0 Flash Lite (very low cost)",
-        "gemini-2.0-flash-exp": "2.0 Flash Experimental (may vary)",
-    }
     if 'selected_gemini_model' not in st.session_state:
         st.session_state.selected_gemini_model = "gemini-2.5-flash-lite"
 
-    chosen = st.selectbox("Model", list(model_options.keys()), format_func=lambda k: model_options[k])
+    chosen = st.selectbox("Model", list(MODEL_OPTIONS.keys()), format_func=lambda k: MODEL_OPTIONS[k])
     st.session_state.selected_gemini_model = chosen
     st.caption("Prefer 2.5 / 2.0 flash-lite for lower cost.")
     st.session_state.show_raw_response = st.checkbox("Show raw response on errors", value=st.session_state.show_raw_response)
 
     if st.button("Initialize / Update Gemini", use_container_width=True, disabled=not google_api_key):
         try:
-            genai.configure(api_key=google_api_key)
+            get_genai().configure(api_key=google_api_key)
+            st.session_state.gemini_api_key = google_api_key
+            fingerprint = hashlib.sha256(google_api_key.encode()).hexdigest()[:16]
             try:
-                st.session_state.gemini_model = genai.GenerativeModel(chosen)
+                st.session_state.gemini_model = get_model(fingerprint, chosen)
                 st.session_state.gemini_initialized = True
                 st.success(f"✅ Initialized model: {chosen}")
             except Exception:
                 fallback = "gemini-1.5-flash-8b"
                 st.warning(f"⚠️ '{chosen}' unavailable. Falling back to {fallback}.")
-                st.session_state.gemini_model = genai.GenerativeModel(fallback)
+                st.session_state.gemini_model = get_model(fingerprint, fallback)
                 st.session_state.gemini_initialized = True
                 st.success(f"✅ Initialized fallback model: {fallback}")
         except Exception as e:
@@ -129,6 +137,7 @@ with st.expander("Data Files Overview"):
         """
         - `syllabus.txt`: Source syllabus content.
         - `test_*.json`: Generated test question sets.
+        - `batch_requests.jsonl`: Tests queued for batch generation, removed once the batch is submitted.
         - `result_*.json`: Saved student attempt + grading details.
         - `analytics_report_*.json`: Exported summary reports from the dashboard.
         """
@@ -1,40 +1,64 @@
 import os  
 import streamlit as st  
 import hmac  
+
+@st.cache_resource(show_spinner=False)
+def get_genai():
+    """Import google.generativeai on first use.
+
+    The SDK pulls in grpc, protobuf and google-auth, so pages only pay for
+    it once a Gemini call is actually made rather than on every cold start.
+    """
+    import google.generativeai as genai
+    return genai
+
     
+# Resolved secrets by name; only hits are kept so a secret added later is still picked up
+_SECRETS = {}
+
+def _get_secret(name: str = "password"):
+    if name not in _SECRETS:
+        try:
+            secret = st.secrets.get(name)
+        except Exception:
+            secret = None
+        secret = secret or os.environ.get("STREAMLIT_PASSWORD")
+        if not secret:
+            return None
+        _SECRETS[name] = secret
+    return _SECRETS[name]
+
 def check_password(secret_name: str = "password"):  
     """Return True if the user entered the correct password.  
   
     Looks for the password in st.secrets[secret_name] first, then  
     falls back to the STREAMLIT_PASSWORD environment variable.  
     If no secret is configured the function shows an error and returns False.  
+    The input lives in a form so the page reruns once per submit, not on  
+    every edit of the field.  
     """  
-    def password_entered():  
-        entered = st.session_state.get("password", "")  
-        secret = st.secrets.get(secret_name) or os.environ.get("STREAMLIT_PASSWORD")  
-        if secret is None:  
-            st.session_state["password_correct"] = False  
-            return  
-        if hmac.compare_digest(entered, secret):  
-            st.session_state["password_correct"] = True  
-            del st.session_state["password"]  
-        else:  
-            st.session_state["password_correct"] = False  
-  
     # Already validated  
     if st.session_state.get("password_correct", False):  
         return True  
   
     # If no configured secret, inform the user  
-    if not (st.secrets.get(secret_name) or os.environ.get("STREAMLIT_PASSWORD")):  
+    secret = _get_secret(secret_name)  
+    if not secret:  
         st.error(  
             "App password is not configured. "  
             "Add `.streamlit/secrets.toml` with `password = \"...\"` or set STREAMLIT_PASSWORD env var."  
         )  
         return False  
   
-    # Show password input  
-    st.text_input("Password", type="password", on_change=password_entered, key="password")  
-    if "password_correct" in st.session_state and not st.session_state["password_correct"]:  
+    # Show password form; cleared from the page once the password is accepted  
+    placeholder = st.empty()  
+    with placeholder.form("login", clear_on_submit=True):  
+        entered = st.text_input("Password", type="password")  
+        if st.form_submit_button("Sign in"):  
+            st.session_state["password_correct"] = hmac.compare_digest(entered, secret)  
+    if st.session_state.get("password_correct", False):  
+        placeholder.empty()  
+        return True  
+    if "password_correct" in st.session_state:  
         st.error("😕 Password incorrect")  
-    return st.session_state.get("password_correct", False)
+    return False  
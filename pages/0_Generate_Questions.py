@@ -11,11 +11,16 @@ DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
 
 import streamlit as st
-import glob
 import re
 import json
-import google.generativeai as genai
-from helper_functions.utility import check_password
+import time
+import hashlib
+import random
+import datetime
+import threading
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from helper_functions.utility import check_password, get_genai
+from helper_functions import json_utils
 
 st.set_page_config(page_title="Generate AIML Test Questions", page_icon="🛠", layout="wide")
 
@@ -29,115 +34,372 @@ st.caption("Load syllabus, configure Gemini, and generate marked questions.")
 # Session state initialization
 for key, default in {
     'syllabus_loaded': False,
+    'batch_job_name': None,
 }.items():
     if key not in st.session_state:
         st.session_state[key] = default
 
+# Cached readers (reruns on every widget interaction reuse the parsed result)
+@st.cache_data(show_spinner=False)
+def _ingest_syllabus(file_id: str, _data: bytes) -> str:
+    return _data.decode('utf-8', errors='replace')
+
+@st.cache_data(ttl=None, show_spinner=False)
+def _read_syllabus_file(path: str, mtime: float) -> str:
+    with open(path, 'r', encoding='utf-8') as f:
+        return f.read()
+
+@st.cache_data(show_spinner=False)
+def _load_test(path: str, mtime: float):
+    with open(path, 'rb') as f:
+        return json_utils.loads(f.read())
+
+_TEST_RE = re.compile(r'test_(\d+)\.json$')
+
+@st.cache_data(ttl=5, show_spinner=False)
+def _scan_tests(dir_mtime: float):
+    """One scandir pass: sorted test_*.json names and the highest test number"""
+    names, max_n = [], 0
+    with os.scandir(DATA_DIR) as it:
+        for e in it:
+            if e.name.startswith('test_') and e.name.endswith('.json'):
+                names.append(e.name)
+                if m := _TEST_RE.match(e.name):
+                    max_n = max(max_n, int(m.group(1)))
+    return sorted(names), max_n
+
+# Prompt sizing: short prompts and tight output caps keep time-to-first-token low
+SYLLABUS_PROMPT_LIMIT = 6000
+_HEADING_RE = re.compile(r':|\s[\u2013-]\s')
+
+def _condense_syllabus(text: str, limit: int = SYLLABUS_PROMPT_LIMIT) -> str:
+    """Keep the first line per distinct heading, capped at `limit` chars"""
+    if len(text) <= limit:
+        return text
+    seen, out, size = set(), [], 0
+    for line in text.splitlines():
+        line = line.strip()
+        if not line:
+            continue
+        heading = _HEADING_RE.split(line, maxsplit=1)[0].strip().lower()
+        if heading in seen:
+            continue
+        if size + len(line) + 1 > limit:
+            break
+        seen.add(heading)
+        out.append(line)
+        size += len(line) + 1
+    return '\n'.join(out)
+
+def _output_token_budget(num_questions: int) -> int:
+    return min(8000, max(512, num_questions * 120))
+
 # Syllabus loader
+BUNDLED_SYLLABUS = DATA_DIR / "syllabus.txt"
+
+def _set_syllabus(content: str) -> bool:
+    if not content.strip():
+        st.error("❌ Syllabus file is empty.")
+        return False
+    st.session_state.syllabus_content = content
+    st.session_state.syllabus_sha = hashlib.sha256(content.encode('utf-8')).hexdigest()
+    st.session_state.syllabus_prompt_chunk = _condense_syllabus(content)
+    st.session_state.syllabus_loaded = True
+    _drop_syllabus_cache()
+    st.success(f"✅ Loaded syllabus ({len(content)} chars)")
+    if st.session_state.get('gemini_initialized') and _syllabus_cache() is not None:
+        st.caption("Syllabus cached on Gemini for 1 hour; generations only send the instructions.")
+    return True
+
 def load_syllabus_from_upload(uploaded_file):
     """Load syllabus from uploaded file"""
     try:
-        content = uploaded_file.read().decode('utf-8')
-        if not content.strip():
-            st.error("❌ Syllabus file is empty.")
-            return False
-        st.session_state.syllabus_content = content
-        st.session_state.syllabus_loaded = True
-        st.success(f"✅ Loaded syllabus ({len(content)} chars)")
-        return True
+        return _set_syllabus(_ingest_syllabus(uploaded_file.file_id, uploaded_file.getvalue()))
+    except Exception as e:
+        st.error(f"❌ Failed to load syllabus: {e}")
+        return False
+
+def load_bundled_syllabus():
+    """Load data/syllabus.txt; the read is shared by all sessions until the file changes"""
+    try:
+        return _set_syllabus(_read_syllabus_file(str(BUNDLED_SYLLABUS), os.path.getmtime(BUNDLED_SYLLABUS)))
     except Exception as e:
         st.error(f"❌ Failed to load syllabus: {e}")
         return False
 
-# Prompt builder
-def build_prompt(syllabus: str, num_questions: int, total_marks: int) -> str:
-    return (
-        f"You are an expert AIML instructor creating a test. Generate exactly {num_questions} questions "
-        f"based ONLY on the syllabus below.\n\n=== SYLLABUS ===\n{syllabus}\n=== END ===\n\n"
-        "Requirements:\n"
-        f"- Cover multiple distinct topics from the syllabus (weeks distribution).\n"
-        f"- Allocate INTEGER marks summing to EXACTLY {total_marks}.\n"
-        "- Answers concise (<= 40 words).\n"
-        "Output formatting:\n"
-        "Return ONLY a raw JSON array (no prose). Each element: {\"question\": string, \"answer\": string, \"marks\": int}."
+# Syllabus context cache: the syllabus is uploaded once per model and hour
+# and billed at the cached-token rate instead of being resent every call
+SYLLABUS_CACHE_TTL = datetime.timedelta(hours=1)
+
+def _drop_syllabus_cache():
+    cache = st.session_state.pop('syllabus_cache', None)
+    st.session_state.pop('syllabus_cache_key', None)
+    if cache is not None:
+        try:
+            cache.delete()
+        except Exception:
+            pass
+
+def _syllabus_cache():
+    """CachedContent for the loaded syllabus on the current model, or None if caching is unavailable"""
+    model_name = st.session_state.gemini_model.model_name
+    key = st.session_state.get('syllabus_cache_key')
+    # Rebuild on model switch and a few minutes before the TTL runs out
+    if key is None or key[0] != model_name or time.time() - key[1] > SYLLABUS_CACHE_TTL.total_seconds() - 300:
+        _drop_syllabus_cache()
+        try:
+            st.session_state.syllabus_cache = get_genai().caching.CachedContent.create(
+                model=model_name,
+                system_instruction=SYSTEM_INSTRUCTION,
+                contents=[st.session_state.syllabus_prompt_chunk],
+                ttl=SYLLABUS_CACHE_TTL,
+            )
+        except Exception:
+            # Syllabus below the model's minimum cacheable size, or caching unsupported
+            st.session_state.syllabus_cache = None
+        st.session_state.syllabus_cache_key = (model_name, time.time())
+    return st.session_state.syllabus_cache
+
+# Prompt builder: static instructions and syllabus first, request parameters last,
+# so the prefix is identical across generations and can be served from cache
+SYSTEM_INSTRUCTION = (
+    "You are an expert AIML instructor creating a test based ONLY on the provided syllabus.\n"
+    "Requirements:\n"
+    "- Cover multiple distinct topics from the syllabus (weeks distribution).\n"
+    "- Answers concise (<= 40 words).\n"
+    "Output formatting:\n"
+    "Return ONLY a raw JSON array (no prose). Each element: {\"question\": string, \"answer\": string, \"marks\": int}."
+)
+
+def build_prompt(syllabus, num_questions: int, total_marks: int) -> str:
+    """Pass syllabus=None when it and the instructions are already in the model's cached context"""
+    task = (
+        f"Generate exactly {num_questions} questions. "
+        f"Allocate INTEGER marks summing to EXACTLY {total_marks}."
     )
+    if syllabus is None:
+        return task
+    return f"{SYSTEM_INSTRUCTION}\n\n=== SYLLABUS ===\n{syllabus}\n=== END ===\n\n{task}"
 
 # JSON helpers
-def _extract_array(text: str) -> str:
-    s = text.find('['); e = text.rfind(']')
-    return text[s:e+1] if s != -1 and e != -1 and e > s else text
+_FENCE_RE = re.compile(r'^[ \t]*```.*\n?', re.MULTILINE)
 
 def _strip_fences(text: str) -> str:
-    if '```' in text:
-        return '\n'.join(l for l in text.splitlines() if not l.strip().startswith('```'))
-    return text
+    return _FENCE_RE.sub('', text) if '```' in text else text
+
+def _clean(text: str) -> str:
+    """Drop code-fence lines and trim to the outermost [...]"""
+    text = _strip_fences(text)
+    s, e = text.find('['), text.rfind(']')
+    return text[s:e+1] if s != -1 and e > s else text
 
 def _try_json(raw: str):
-    cand = _extract_array(_strip_fences(raw.strip()))
+    cand = raw.strip()
+    # Schema-constrained output is already a bare array; only fenced or prose-wrapped text needs cleaning
+    if not (cand.startswith('[') and cand.endswith(']')):
+        cand = _clean(cand)
     try:
-        data = json.loads(cand)
-        if isinstance(data, list) and all(isinstance(x, dict) for x in data):
-            return data
-    except Exception:
+        data = json_utils.loads(cand)
+    except ValueError:
         return None
-    return None
+    if not isinstance(data, list):
+        return None
+    for x in data:
+        if not isinstance(x, dict):
+            return None
+    return data
+
+_DECODER = json.JSONDecoder()
+
+def _array_body(raw: str) -> str:
+    return _strip_fences(raw).lstrip().lstrip('[')
+
+def _scan_objects(t: str, start: int = 0):
+    """Decode consecutive top-level objects from t[start:]; returns (objs, resume_idx)."""
+    i, n, objs = start, len(t), []
+    while i < n:
+        while i < n and t[i] in ' \t\r\n,':
+            i += 1
+        if i >= n or t[i] != '{':
+            break
+        try:
+            obj, end = _DECODER.raw_decode(t, i)
+        except json.JSONDecodeError:
+            break
+        if isinstance(obj, dict):
+            objs.append(obj)
+        i = end
+    return objs, i
 
 def _partial_objects(raw: str):
-    t = _strip_fences(raw.strip())
-    if t.startswith('['):
-        t = t[1:]
-    objs, level, buf = [], 0, []
-    for ch in t:
-        buf.append(ch)
-        if ch == '{':
-            level += 1
-        elif ch == '}':
-            level -= 1
-            if level == 0:
-                obj_str = ''.join(buf).strip().rstrip(',')
-                try:
-                    o = json.loads(obj_str)
-                    if isinstance(o, dict):
-                        objs.append(o)
-                        buf = []
-                except Exception:
-                    pass
-    return objs
+    return _scan_objects(_array_body(raw))[0]
+
+def _parse_response(raw: str):
+    # The partial scan only matters when the array was cut off at max_output_tokens
+    return _try_json(raw) or _partial_objects(raw)
+
+# Streaming call: report each JSON object as soon as it closes
+def _stream_response(model, prompt: str, cfg: dict, on_object=None, limit=None) -> str:
+    """Stops reading once `limit` objects have arrived; the cut-off tail is recovered by _partial_objects"""
+    resp = model.generate_content(prompt, generation_config=cfg, stream=True)
+    raw, seen, idx = "", 0, -1
+    for chunk in resp:
+        if not chunk.parts:
+            continue
+        raw += chunk.text
+        if on_object is None:
+            continue
+        if idx < 0:
+            # Skip any fence/prose before the opening bracket once; after that the
+            # prefix is fixed and the raw buffer can be scanned in place
+            start = raw.find('[')
+            if start < 0:
+                continue
+            idx = start + 1
+        # Resume after the last complete object instead of rescanning the buffer
+        objs, idx = _scan_objects(raw, idx)
+        for o in objs:
+            on_object(seen, o)
+            seen += 1
+        if limit is not None and seen >= limit:
+            break
+    return raw
+
+# Rate limits: quota errors (429) back off 10 * 2**attempt seconds, other errors are fatal
+RETRY_ATTEMPTS = 6
+
+def _with_backoff(call, *args, on_retry=None, stop=None, **kwargs):
+    """stop: optional threading.Event; once set, the pending retry is abandoned"""
+    from google.api_core.exceptions import ResourceExhausted
+    for attempt in range(RETRY_ATTEMPTS):
+        try:
+            return call(*args, **kwargs)
+        except ResourceExhausted:
+            if attempt == RETRY_ATTEMPTS - 1 or (stop is not None and stop.is_set()):
+                raise
+            delay = 10 * 2 ** attempt + random.random()
+            if on_retry is not None:
+                on_retry(delay)
+            if stop is None:
+                time.sleep(delay)
+            elif stop.wait(delay):
+                raise
+
+def _request_text(model, prompt: str, cfg: dict) -> str:
+    # Runs on worker threads: no Streamlit calls in here
+    return model.generate_content(prompt, generation_config=cfg).text or ""
+
+def _first_valid(model, cfg: dict, candidates):
+    """Send (prompt, accept) candidates concurrently; return the first accepted result.
+
+    accept(items) maps a parsed response to the final list, or None to reject it.
+    """
+    pool, stop = ThreadPoolExecutor(max_workers=len(candidates)), threading.Event()
+    futures = {pool.submit(_with_backoff, _request_text, model, p, cfg, stop=stop): accept for p, accept in candidates}
+    try:
+        for fut in as_completed(futures):
+            try:
+                result = futures[fut](_parse_response(fut.result()))
+            except Exception:
+                continue
+            if result:
+                return result
+        return None
+    finally:
+        # Do not wait for the slower request; its answer is no longer needed.
+        # Cancelling only covers unstarted futures, so also stop a running one from retrying
+        stop.set()
+        pool.shutdown(wait=False, cancel_futures=True)
+
+# Constrained decoding: Gemini emits exactly this shape, so the response parses directly
+QUESTION_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {
+            "question": {"type": "STRING"},
+            "answer": {"type": "STRING"},
+            "marks": {"type": "INTEGER"},
+        },
+        "required": ["question", "answer", "marks"],
+    },
+}
+GENERATION_CONFIG = {
+    "response_mime_type": "application/json",
+    "response_schema": QUESTION_SCHEMA,
+    "max_output_tokens": 8000,
+    "temperature": 0.2,
+}
+def _apportion_marks(items: list, total_marks: int) -> list:
+    """Rescale marks to sum to total_marks, instead of asking the model again.
+
+    Every question keeps at least 1 mark (callers ensure total_marks >= len(items));
+    the rest is shared in proportion to the model's marks by largest remainder.
+    """
+    marks = []
+    for o in items:
+        m = o.get('marks')
+        marks.append(max(int(m), 1) if isinstance(m, (int, float)) else 1)
+    given = sum(marks)
+    if given != total_marks:
+        spare = total_marks - len(items)
+        quotas = [m * spare / given for m in marks]
+        shares = [int(q) for q in quotas]
+        by_remainder = sorted(range(len(items)), key=lambda i: quotas[i] - shares[i], reverse=True)
+        for i in by_remainder[:spare - sum(shares)]:
+            shares[i] += 1
+        marks = [1 + m for m in shares]
+    for o, m in zip(items, marks):
+        o['marks'] = m
+    return items
 
 # Generation with continuation
-def generate_questions(prompt: str, expected: int, total_marks: int, retries: int = 1):
+def generate_questions(prompt: str, expected: int, total_marks: int, retries: int = 1, on_item=None, model=None):
     if not st.session_state.get('gemini_initialized'):
         st.error("Gemini not initialized.")
         return None
-    cfg = {"response_mime_type": "text/plain", "max_output_tokens": 8000, "temperature": 0.2}
+    model = model or st.session_state.gemini_model
+    cfg = dict(GENERATION_CONFIG, max_output_tokens=_output_token_budget(expected))
+
+    def emit(i, obj):
+        if on_item is not None and i < expected:
+            on_item(i, obj)
+
     attempt = 0; last_raw = ""
     while attempt <= retries:
         try:
             p = prompt if attempt == 0 else prompt + "\nREMINDER: ONLY RAW JSON ARRAY."
-            resp = st.session_state.gemini_model.generate_content(p, generation_config=cfg)
-            last_raw = resp.text or ""
-            parsed = _try_json(last_raw)
+            last_raw = _with_backoff(
+                _stream_response, model, p, cfg, on_object=emit, limit=expected,
+                on_retry=lambda d: st.toast(f"⏳ Rate limited, retrying in {d:.0f}s"),
+            )
+            # The last chunk read may close more objects than asked for
+            parsed = _parse_response(last_raw)[:expected]
             if parsed and len(parsed) == expected:
-                return parsed
-            if not parsed:
-                parsed = _partial_objects(last_raw)
+                return _apportion_marks(parsed, total_marks)
             if parsed and len(parsed) < expected:
-                used = sum(int(o.get('marks', 0)) for o in parsed if isinstance(o.get('marks', 0), (int, float)))
+                used = 0
+                for o in parsed:
+                    m = o.get('marks')
+                    if isinstance(m, (int, float)):
+                        used += int(m)
                 remain_count = expected - len(parsed)
                 remain_marks = max(total_marks - used, remain_count)
                 st.info(f"Partial ({len(parsed)}/{expected}) received. Requesting {remain_count} more...")
                 cont = (
-                    "You previously generated these objects (do NOT repeat):\n" + json.dumps(parsed, indent=2) + "\n" +
+                    "You previously generated these objects (do NOT repeat):\n" + json_utils.dumps(parsed, indent=True).decode('utf-8') + "\n" +
                     f"Now return ONLY a JSON array with {remain_count} NEW objects to complete {expected}. "
                     f"Distribute INTEGER marks totaling {remain_marks}. Each object: {{\"question\": string, \"answer\": string, \"marks\": int}}. "
                     "No prose, no backticks."
                 )
-                c_resp = st.session_state.gemini_model.generate_content(cont, generation_config=cfg)
-                c_raw = c_resp.text or ""
-                new_items = _try_json(c_raw) or _partial_objects(c_raw)
-                if new_items:
-                    combined = parsed + new_items
-                    return combined[:expected]
+                # Race the continuation against a full restart and keep whichever is usable first
+                restart = prompt + "\nRESTART. Emit ONLY a JSON array."
+                combined = _first_valid(model, cfg, [
+                    (cont, lambda items: (parsed + items)[:expected] if items else None),
+                    (restart, lambda items: items if len(items) == expected else None),
+                ])
+                if combined:
+                    return _apportion_marks(combined, total_marks)
         except Exception as e:
             st.error(f"❌ Generation failed: {e}")
             break
@@ -147,6 +409,140 @@ def generate_questions(prompt: str, expected: int, total_marks: int, retries: in
         st.text_area("Raw Response", last_raw, height=240)
     return None
 
+# Response cache: identical (syllabus, questions, marks, model) requests reuse the
+# last generated test for an hour instead of paying for another round trip
+RESPONSE_CACHE_TTL = 3600
+# The cache dict is shared by every session thread
+_RESPONSE_CACHE_LOCK = threading.Lock()
+
+@st.cache_resource(show_spinner=False)
+def _response_cache() -> dict:
+    return {}
+
+def _cached_generation(key):
+    with _RESPONSE_CACHE_LOCK:
+        hit = _response_cache().get(key)
+    if hit is None or time.time() - hit[0] > RESPONSE_CACHE_TTL:
+        return None
+    return hit[1:]
+
+def _remember_generation(key, data, filename, payload):
+    cache, now = _response_cache(), time.time()
+    with _RESPONSE_CACHE_LOCK:
+        for k in [k for k, hit in cache.items() if now - hit[0] > RESPONSE_CACHE_TTL]:
+            del cache[k]
+        cache[key] = (now, data, filename, payload)
+
+# Batch generation (Gemini Batch API: half price, no interactive rate limits)
+BATCH_QUEUE = DATA_DIR / "batch_requests.jsonl"
+
+def _batch_client():
+    from google import genai as genai_sdk
+    return genai_sdk.Client(api_key=st.session_state.gemini_api_key)
+
+def _queued_batch_requests() -> int:
+    if not BATCH_QUEUE.exists():
+        return 0
+    with open(BATCH_QUEUE, 'r', encoding='utf-8') as f:
+        return sum(1 for line in f if line.strip())
+
+# The key carries the requested shape, so collected responses can be checked against it
+_BATCH_KEY_RE = re.compile(r'test_\d+_q(\d+)_m(\d+)$')
+
+def queue_batch_request(prompt: str, num_questions: int, total_marks: int) -> int:
+    """Append one generation request to the batch queue; returns the queue length"""
+    key = f"test_{_queued_batch_requests() + 1}_q{num_questions}_m{total_marks}"
+    line = {"key": key, "request": {"contents": [{"parts": [{"text": prompt}]}], "generation_config": dict(GENERATION_CONFIG, max_output_tokens=_output_token_budget(num_questions))}}
+    with open(BATCH_QUEUE, 'ab') as f:
+        f.write(json_utils.dumps(line) + b"\n")
+    return _queued_batch_requests()
+
+def submit_batch() -> bool:
+    try:
+        client = _batch_client()
+        up = client.files.upload(file=str(BATCH_QUEUE), config={"mime_type": "jsonl"})
+        job = client.batches.create(model=st.session_state.selected_gemini_model, src=up.name)
+        st.session_state.batch_job_name = job.name
+        BATCH_QUEUE.unlink()
+        st.success(f"✅ Submitted batch job {job.name}")
+        return True
+    except Exception as e:
+        st.error(f"❌ Batch submission failed: {e}")
+        return False
+
+def _batch_result(line: str):
+    """(key, questions, problem) for one line of batch output; questions is None when problem is set"""
+    try:
+        row = json_utils.loads(line)
+    except ValueError as e:
+        return None, None, f"unreadable output line ({e})"
+    if not isinstance(row, dict):
+        return None, None, "unreadable output line"
+    key = row.get('key')
+    m = _BATCH_KEY_RE.match(str(key))
+    if m is None:
+        return key, None, "no recorded question count or total marks"
+    expected, total_marks = int(m.group(1)), int(m.group(2))
+    try:
+        raw = row['response']['candidates'][0]['content']['parts'][0]['text']
+    except (KeyError, IndexError, TypeError):
+        return key, None, f"no response: {row.get('error', 'unknown error')}"
+    # Same acceptance as the interactive path: exactly the requested count, marks rescaled to the total
+    data = _parse_response(raw)[:expected]
+    if len(data) != expected:
+        return key, None, f"incomplete response ({len(data)}/{expected} questions)"
+    return key, _apportion_marks(data, total_marks), None
+
+def collect_batch() -> list:
+    """Save each succeeded batch response as test_N.json; returns saved filenames"""
+    client = _batch_client()
+    job = client.batches.get(name=st.session_state.batch_job_name)
+    state = job.state.name
+    if state != 'JOB_STATE_SUCCEEDED':
+        if state in ('JOB_STATE_FAILED', 'JOB_STATE_CANCELLED', 'JOB_STATE_EXPIRED'):
+            st.error(f"❌ Batch job ended with {state}")
+            st.session_state.batch_job_name = None
+        else:
+            st.info(f"⏳ Batch job state: {state}")
+        return []
+    saved = []
+    _, max_n = _scan_tests(os.path.getmtime(DATA_DIR))
+    content = client.files.download(file=job.dest.file_name).decode('utf-8')
+    try:
+        for line in content.splitlines():
+            if not line.strip():
+                continue
+            key, data, problem = _batch_result(line)
+            if problem:
+                st.warning(f"⚠️ Skipped {key or 'batch output'}: {problem}")
+                continue
+            filename = f"test_{max_n + 1}.json"
+            try:
+                with open(DATA_DIR / filename, 'wb') as f:
+                    f.write(json_utils.dumps(data))
+            except OSError as e:
+                st.warning(f"⚠️ Could not save {key} as data/{filename}: {e}")
+                continue
+            max_n += 1
+            saved.append(filename)
+    finally:
+        # Some files may already be written; never collect the same job twice
+        st.session_state.batch_job_name = None
+    return saved
+
+# Rendering
+def _render_item(i: int, item: dict):
+    with st.expander(f"Q{i} ({item.get('marks','?')} marks)"):
+        st.markdown(f"**Question:** {item.get('question','')}")
+        st.markdown(f"**Answer:** {item.get('answer','')}")
+
+@st.fragment
+def _render_results(data: list, payload: bytes, filename: str):
+    """Reruns on its own, so the download click leaves the rest of the page alone"""
+    for i, item in enumerate(data, 1):
+        _render_item(i, item)
+    st.download_button("📥 Download JSON", payload, file_name=filename, mime='application/json', use_container_width=True)
+
 # UI: Syllabus Loader
 st.header("📥 Syllabus")
 uploaded_syllabus = st.file_uploader(
@@ -158,10 +554,16 @@ uploaded_syllabus = st.file_uploader(
 if uploaded_syllabus is not None:
     if st.button("Load Uploaded Syllabus", use_container_width=True):
         load_syllabus_from_upload(uploaded_syllabus)
+elif BUNDLED_SYLLABUS.exists():
+    if st.button("Load data/syllabus.txt", use_container_width=True):
+        load_bundled_syllabus()
 
 if st.session_state.get('syllabus_loaded'):
     with st.expander("Preview Syllabus", expanded=False):
-        st.code(st.session_state.syllabus_content[:2000] + ('..."' if len(st.session_state.syllabus_content) > 2000 else ''), language='text')
+        content = st.session_state.syllabus_content
+        st.code(content[:2000], language='text')
+        if len(content) > 2000:
+            st.caption(f"… {len(content) - 2000} more characters")
 
 st.divider()
 
@@ -172,65 +574,114 @@ with left:
     num_questions = st.number_input("Number of Questions", 1, 50, 20)
 with right:
     total_marks = st.number_input("Total Marks", 1, 500, 100)
+reuse_cached = st.checkbox("Reuse the last test generated with identical settings", value=True,
+                           help="Untick to force a fresh set of questions.")
 
 if st.button("Generate Test", type="primary", use_container_width=True):
     if not st.session_state.gemini_initialized:
         st.warning("⚠️ Initialize Gemini first in the sidebar.")
     elif not st.session_state.syllabus_loaded:
         st.warning("⚠️ Load the syllabus before generating questions.")
+    elif total_marks < num_questions:
+        st.warning("⚠️ Total marks must be at least the number of questions (1 mark each).")
     else:
-        syllabus = st.session_state.syllabus_content
-        prompt = build_prompt(syllabus, num_questions, total_marks)
-        with st.spinner("Generating questions..."):
-            data = generate_questions(prompt, expected=num_questions, total_marks=total_marks)
-        if data:
-            # Save file
-            existing = glob.glob(str(DATA_DIR / "test_*.json"))
-            max_num = 0
-            for fn in existing:
-                m = re.search(r'test_(\d+)\.json', fn)
-                if m:
-                    max_num = max(max_num, int(m.group(1)))
-            filename = f"test_{max_num+1}.json"
-            file_path = DATA_DIR / filename
+        response_key = (st.session_state.syllabus_sha, num_questions, total_marks, st.session_state.gemini_model.model_name)
+        hit = _cached_generation(response_key) if reuse_cached else None
+        if hit:
+            data, filename, payload = hit
+            st.info(f"♻️ Same settings as data/{filename}; reusing it.")
+            st.subheader("Generated Questions")
+            _render_results(data, payload, filename)
+        else:
+            cache = _syllabus_cache()
+            model = get_genai().GenerativeModel.from_cached_content(cached_content=cache) if cache else None
+            prompt = build_prompt(None if cache else st.session_state.syllabus_prompt_chunk, num_questions, total_marks)
+            st.subheader("Generated Questions")
+            # One slot per expected question, painted as each object streams in;
+            # a retry or continuation repaints its slot instead of appending
+            slots = [st.empty() for _ in range(num_questions)]
+
+            def show_item(i, item):
+                with slots[i].container():
+                    _render_item(i + 1, item)
+
+            with st.spinner("Generating questions..."):
+                data = generate_questions(prompt, expected=num_questions, total_marks=total_marks, on_item=show_item, model=model)
+            # Streamed slots are provisional; the fragment below shows what is saved
+            for slot in slots:
+                slot.empty()
+            if data:
+                # Save file
+                _, max_n = _scan_tests(os.path.getmtime(DATA_DIR))
+                filename = f"test_{max_n + 1}.json"
+                file_path = DATA_DIR / filename
+                payload = json_utils.dumps(data, indent=True)
+                try:
+                    # Compact on disk (only ever read back by code); indented for the download
+                    with open(file_path, 'wb') as f:
+                        f.write(json_utils.dumps(data))
+                    st.success(f"✅ Saved test to data/{filename}")
+                    _remember_generation(response_key, data, filename, payload)
+                except Exception as e:
+                    st.error(f"❌ Failed to save: {e}")
+                _render_results(data, payload, filename)
+
+with st.expander("🗂 Batch Generation", expanded=False):
+    st.caption("Queue several tests (e.g. one per module) and generate them together through the Gemini Batch API at half the token price. Results usually arrive within minutes but can take up to 24 hours.")
+    queued = _queued_batch_requests()
+    b_left, b_right = st.columns(2)
+    with b_left:
+        if st.button("Queue for batch generation", use_container_width=True):
+            if not st.session_state.syllabus_loaded:
+                st.warning("⚠️ Load the syllabus before queueing questions.")
+            elif total_marks < num_questions:
+                st.warning("⚠️ Total marks must be at least the number of questions (1 mark each).")
+            else:
+                queued = queue_batch_request(build_prompt(st.session_state.syllabus_prompt_chunk, num_questions, total_marks), num_questions, total_marks)
+                st.success(f"✅ Queued ({queued} request(s) pending)")
+    with b_right:
+        if st.button("Submit batch", use_container_width=True, disabled=not queued or bool(st.session_state.batch_job_name)):
+            if not st.session_state.get('gemini_api_key'):
+                st.warning("⚠️ Initialize Gemini first in the sidebar.")
+            else:
+                submit_batch()
+    st.caption(f"Pending requests: {queued}")
+    if st.session_state.batch_job_name:
+        st.markdown(f"**Running job:** `{st.session_state.batch_job_name}`")
+        if st.button("Check batch status", use_container_width=True):
             try:
-                with open(file_path, 'w', encoding='utf-8') as f:
-                    json.dump(data, f, indent=4)
-                st.success(f"✅ Saved test to data/{filename}")
+                saved = collect_batch()
+                if saved:
+                    st.success(f"✅ Saved {', '.join(saved)}")
             except Exception as e:
-                st.error(f"❌ Failed to save: {e}")
-
-            st.subheader("Generated Questions")
-            for i, item in enumerate(data, 1):
-                with st.expander(f"Q{i} ({item.get('marks','?')} marks)"):
-                    st.markdown(f"**Question:** {item.get('question','')}")
-                    st.markdown(f"**Answer:** {item.get('answer','')}")
-            with open(file_path, 'r', encoding='utf-8') as f:
-                st.download_button("📥 Download JSON", f.read(), file_name=filename, mime='application/json', use_container_width=True)
+                st.error(f"❌ Could not check batch job: {e}")
 
 st.divider()
 
 # Existing tests
 st.header("📂 Existing Test Files")
-files = sorted(glob.glob(str(DATA_DIR / "test_*.json")))
-if files:
-    # Show basenames for selection
-    display_map = {Path(f).name: f for f in files}
-    selected_name = st.selectbox("Select a file to preview", list(display_map.keys()))
-    selected = display_map[selected_name]
-    if selected:
-        try:
-            with open(selected, 'r', encoding='utf-8') as f:
-                test_data = json.load(f)
-            st.markdown(f"**File:** `data/{Path(selected).name}` | **Questions:** {len(test_data)}")
-            for i, item in enumerate(test_data, 1):
-                with st.expander(f"Q{i} ({item.get('marks','?')} marks)"):
-                    st.markdown(f"**Question:** {item.get('question','')}")
-                    st.markdown(f"**Answer:** {item.get('answer','')}")
-        except Exception as e:
-            st.error(f"❌ Error reading file: {e}")
-else:
-    st.info("No tests generated yet.")
+
+# Picking another file reruns only this fragment, not syllabus/generation code
+@st.fragment
+def _existing_tests():
+    files, _ = _scan_tests(os.path.getmtime(DATA_DIR))
+    if files:
+        # Show basenames for selection
+        display_map = {name: str(DATA_DIR / name) for name in files}
+        selected_name = st.selectbox("Select a file to preview", list(display_map.keys()))
+        selected = display_map[selected_name]
+        if selected:
+            try:
+                test_data = _load_test(selected, os.path.getmtime(selected))
+                st.markdown(f"**File:** `data/{Path(selected).name}` | **Questions:** {len(test_data)}")
+                for i, item in enumerate(test_data, 1):
+                    _render_item(i, item)
+            except Exception as e:
+                st.error(f"❌ Error reading file: {e}")
+    else:
+        st.info("No tests generated yet.")
+
+_existing_tests()
 
 st.divider()
 st.caption("Generate Questions Page • AIML Test Suite")
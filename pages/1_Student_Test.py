@@ -1,15 +1,26 @@
 # -*- coding: utf-8 -*-
 """Student Test Page - Take a test and get scored"""
 
+import os
+import hashlib
 import streamlit as st
 import json
 import glob
 from pathlib import Path
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
-DATA_DIR.mkdir(exist_ok=True)
+
+@st.cache_resource(show_spinner=False)
+def _ensure_data_dir():
+    # Once per process rather than a stat on every rerun
+    DATA_DIR.mkdir(exist_ok=True)
+    return True
+
+_ensure_data_dir()
 from datetime import datetime
-import google.generativeai as genai
+from collections import namedtuple
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from helper_functions.utility import check_password
+from helper_functions import json_utils
 
 # Page configuration
 st.set_page_config(
@@ -22,6 +33,120 @@ st.set_page_config(
 if not check_password():
     st.stop()
 
+@st.cache_data(ttl=5, show_spinner=False)
+def _list_tests():
+    """(label, path) per test file; the short TTL picks up newly generated tests"""
+    return [(Path(p).name, p) for p in sorted(glob.glob(str(DATA_DIR / "test_*.json")))]
+
+def _qhash(question: str) -> str:
+    # Short fixed-size digest: cheaper to store and compare than the full question text
+    return hashlib.blake2b(question.encode('utf-8'), digest_size=8).hexdigest()
+
+@st.cache_data(show_spinner=False)
+def _load_test(path: str, mtime: float):
+    with open(path, 'rb') as f:
+        return json_utils.loads(f.read())
+
+# One record per question with defaults applied, built once at load
+Question = namedtuple('Question', 'idx question answer marks qhash')
+
+def _to_questions(test: list) -> list:
+    qs = []
+    for i, item in enumerate(test, 1):
+        question = item.get('question', 'N/A')
+        qs.append(Question(i, question, item.get('answer', 'N/A'), item.get('marks', 0), _qhash(question)))
+    return qs
+
+# Grading
+GRADING_INSTRUCTIONS = """Instructions:
+1. Compare the student's answer with the expected answer
+2. Award partial credit for partially correct answers
+3. Consider key concepts, accuracy, and completeness
+4. If the answer is empty or completely wrong, give 0 marks
+5. Provide brief, constructive feedback (1-2 sentences)"""
+
+# Schema-constrained JSON output: the reply always decodes, so no fence/brace/regex fallbacks
+GRADE_PROPERTIES = {
+    "marks": {"type": "NUMBER"},
+    "feedback": {"type": "STRING"},
+}
+GRADE_SCHEMA = {"type": "OBJECT", "properties": GRADE_PROPERTIES, "required": ["marks", "feedback"]}
+BATCH_GRADE_SCHEMA = {
+    "type": "ARRAY",
+    "items": {
+        "type": "OBJECT",
+        "properties": {"qid": {"type": "INTEGER"}, **GRADE_PROPERTIES},
+        "required": ["qid", "marks", "feedback"],
+    },
+}
+
+# ~300 output tokens per graded answer; batches stay under the 8192-token output cap of the 2.0 Flash models
+GRADE_TOKENS_PER_ANSWER = 300
+GRADE_MAX_OUTPUT_TOKENS = 8000
+GRADE_BATCH_SIZE = GRADE_MAX_OUTPUT_TOKENS // GRADE_TOKENS_PER_ANSWER
+
+def _grading_config(schema: dict, max_output_tokens: int) -> dict:
+    return {
+        "temperature": 0.3,
+        "max_output_tokens": max_output_tokens,
+        "response_mime_type": "application/json",
+        "response_schema": schema,
+    }
+
+def _grade_batch(model, pending: dict) -> dict:
+    """Grade up to GRADE_BATCH_SIZE answers in one request; pending is {idx: (Question, student_answer)}.
+    Returns {i: (marks, feedback)} for the entries the model graded."""
+    entries = [
+        {"qid": i, "question": q.question, "expected": q.answer, "student": answer, "max_marks": q.marks}
+        for i, (q, answer) in pending.items()
+    ]
+    prompt = f"""You are an expert teacher grading a student's answers. Be fair, constructive, and precise.
+
+Each entry has a qid, the question, the correct/expected answer, the student's answer and the maximum marks:
+{json.dumps(entries, ensure_ascii=False)}
+
+{GRADING_INSTRUCTIONS}
+
+Return one object per entry with its qid, marks between 0 and its max_marks, and the feedback."""
+    response = model.generate_content(prompt, generation_config=_grading_config(BATCH_GRADE_SCHEMA, GRADE_TOKENS_PER_ANSWER * len(entries)))
+    try:
+        result = json_utils.loads(response.text)
+    except ValueError:
+        # Truncated at max_output_tokens; the caller grades these one by one
+        return {}
+    graded = {}
+    for row in result if isinstance(result, list) else []:
+        try:
+            i = int(row['qid'])
+            max_marks = pending[i][0].marks
+            graded[i] = (min(max(0, float(row.get('marks', 0))), max_marks), row.get('feedback', 'Graded by AI'))
+        except (TypeError, KeyError, ValueError, AttributeError):
+            continue
+    return graded
+
+def _grade_one(model, q: Question, student_answer: str):
+    """Single-question fallback for anything the batch request missed; returns (marks, feedback)"""
+    max_marks = q.marks
+    grading_prompt = f"""You are an expert teacher grading a student's answer. Be fair, constructive, and precise.
+
+Question: {q.question}
+
+Correct/Expected Answer: {q.answer}
+
+Student's Answer: {student_answer}
+
+Maximum Marks: {max_marks}
+
+{GRADING_INSTRUCTIONS}
+
+Return marks between 0 and {max_marks} and the feedback."""
+    response = model.generate_content(grading_prompt, generation_config=_grading_config(GRADE_SCHEMA, GRADE_TOKENS_PER_ANSWER))
+    try:
+        result = json_utils.loads(response.text)
+        return min(max(0, float(result['marks'])), max_marks), result.get('feedback', 'Graded by AI')
+    except (ValueError, TypeError, KeyError):
+        return 0, f"Unable to parse AI response. Raw: {response.text[:100]}"
+
 st.title("✏️ Student Test")
 st.markdown("Select a test, answer the questions, and see your score!")
 
@@ -56,22 +181,24 @@ st.divider()
 
 # Test selection
 st.header("📚 Select Test")
-test_files = glob.glob(str(DATA_DIR / "test_*.json"))
+test_files = _list_tests()
 
 if not test_files:
     st.warning("⚠️ No tests available. Please generate a test first from the main page.")
     st.stop()
 
-test_files.sort()
-display_map = {Path(f).name: f for f in test_files}
+display_map = dict(test_files)
 selected_label = st.selectbox("Choose a test:", list(display_map.keys()), key="test_selector")
 selected_test = display_map[selected_label]
 
 # Load test button
 if st.button("Load Test", type="primary", use_container_width=True):
     try:
-        with open(selected_test, 'r', encoding='utf-8') as f:
-            st.session_state.current_test = json.load(f)
+        st.session_state.current_test = _load_test(selected_test, os.path.getmtime(selected_test))
+        # Fixed for the loaded test, so compute once rather than on every rerun
+        st.session_state.qs = _to_questions(st.session_state.current_test)
+        st.session_state.total_marks = sum(q.marks for q in st.session_state.qs)
+        st.session_state.num_questions = len(st.session_state.qs)
         st.session_state.student_answers = {}
         st.session_state.test_submitted = False
         st.success(f"✅ Test loaded: {selected_test}")
@@ -79,361 +206,294 @@ if st.button("Load Test", type="primary", use_container_width=True):
     except Exception as e:
         st.error(f"❌ Error loading test: {e}")
 
-# Display test if loaded
-if st.session_state.current_test:
-    st.divider()
-    st.header("📝 Answer the Questions")
+def _render_form():
+    """Answer form for the loaded test"""
+    # Show test questions
+    st.info(f"**Test Details:** {st.session_state.num_questions} questions | Total Marks: {st.session_state.total_marks}")
     
-    if not st.session_state.test_submitted:
-        # Show test questions
-        total_marks = sum(item.get('marks', 0) for item in st.session_state.current_test)
-        st.info(f"**Test Details:** {len(st.session_state.current_test)} questions | Total Marks: {total_marks}")
-        
-        # Create answer form
-        with st.form("test_form"):
-            for i, item in enumerate(st.session_state.current_test, 1):
-                st.subheader(f"Question {i} ({item.get('marks', 0)} marks)")
-                question_text = item.get('question', 'N/A')
-                st.markdown(f"**{question_text}**")
-                
-                # Create unique key for this question based on question text
-                question_hash = str(hash(question_text))
-                answer_key = f"q_{i}"
-                
-                # Try to load from history first, then current session
-                previous_answer = st.session_state.answer_history.get(question_hash, "")
-                current_answer = st.session_state.student_answers.get(answer_key, previous_answer)
-                
-                # Show hint if previous answer exists
-                if previous_answer and not st.session_state.student_answers.get(answer_key):
-                    st.caption("💡 Previous answer loaded from history")
-                
-                student_answer = st.text_area(
-                    f"Your answer for Question {i}:",
-                    value=current_answer,
-                    key=f"answer_{i}",
-                    height=100,
-                    placeholder="Type your answer here..."
-                )
-                st.session_state.student_answers[answer_key] = student_answer
-                
-                # Save to history as they type
-                if student_answer.strip():
-                    st.session_state.answer_history[question_hash] = student_answer
-                
-                st.divider()
+    # Create answer form
+    with st.form("test_form"):
+        for q in st.session_state.qs:
+            i = q.idx
+            st.subheader(f"Question {i} ({q.marks} marks)")
+            st.markdown(f"**{q.question}**")
+            
+            # Try to load from history first (keyed by the load-time digest), then current session
+            previous_answer = st.session_state.answer_history.get(q.qhash, "")
+            saved_answer = st.session_state.student_answers.get(i)
+            current_answer = previous_answer if saved_answer is None else saved_answer
+            
+            # Show hint if previous answer exists
+            if previous_answer and not saved_answer:
+                st.caption("💡 Previous answer loaded from history")
             
-            submitted = st.form_submit_button("Submit Test", type="primary", use_container_width=True)
+            student_answer = st.text_area(
+                f"Your answer for Question {i}:",
+                value=current_answer,
+                key=f"answer_{i}",
+                height=100,
+                placeholder="Type your answer here..."
+            )
+            if student_answer != saved_answer:
+                st.session_state.student_answers[i] = student_answer
+            
+            st.divider()
+        
+        submitted = st.form_submit_button("Submit Test", type="primary", use_container_width=True)
+        
+        if submitted:
+            # Save to history once per submit, even if validation below fails
+            history = st.session_state.answer_history
+            for q in st.session_state.qs:
+                answer = st.session_state.student_answers.get(q.idx, "")
+                if answer.strip():
+                    history[q.qhash] = answer
             
-            if submitted:
-                if not st.session_state.student_name:
-                    st.error("❌ Please enter your name before submitting!")
+            if not st.session_state.student_name:
+                st.error("❌ Please enter your name before submitting!")
+            else:
+                # Check if all questions are answered (the form loop above set every key)
+                unanswered = [i for i, ans in st.session_state.student_answers.items() if not ans.strip()]
+                
+                if unanswered:
+                    st.warning(f"⚠️ You have not answered question(s): {', '.join(map(str, unanswered))}")
                 else:
-                    # Check if all questions are answered
-                    unanswered = []
-                    for i in range(1, len(st.session_state.current_test) + 1):
-                        if not st.session_state.student_answers.get(f"q_{i}", "").strip():
-                            unanswered.append(i)
-                    
-                    if unanswered:
-                        st.warning(f"⚠️ You have not answered question(s): {', '.join(map(str, unanswered))}")
-                    else:
-                        st.session_state.test_submitted = True
-                        st.rerun()
+                    st.session_state.test_submitted = True
+                    st.rerun()
+
+def _render_results():
+    """Answer review, grading, final score and reset buttons after submission"""
+    # Show results after submission
+    st.success("✅ Test submitted successfully!")
+    st.divider()
+    st.header("📊 Test Results")
+    
+    total_marks = st.session_state.total_marks
+    
+    # Display student info
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        st.metric("Student Name", st.session_state.student_name)
+    with col2:
+        st.metric("Test File", Path(selected_test).name)
+    
+    st.divider()
+    
+    # Show answers and correct answers: one markdown block instead of an expander and columns per question
+    review = []
+    for q in st.session_state.qs:
+        student_ans = st.session_state.student_answers.get(q.idx, "").strip()
+        review.append(
+            f"#### Question {q.idx} ({q.marks} marks)\n"
+            f"**Question:** {q.question}\n\n"
+            f"**Your Answer:** {student_ans or '_No answer provided_'}\n\n"
+            f"**Correct Answer:** {q.answer}\n"
+        )
+    st.markdown("\n---\n".join(review))
+    
+    st.divider()
+    
+    # AI-Powered Grading Section
+    st.header("🤖 AI-Powered Grading")
+    st.markdown(f"**Total Possible Marks:** {total_marks}")
     
+    # Check if Gemini is initialized
+    if not st.session_state.get('gemini_initialized', False):
+        st.warning("⚠️ Please initialize Gemini AI from the About AIBC landing page first (enter API key in the sidebar and click Initialize).")
+        st.info("💡 Once initialized, you can use AI to automatically grade student answers.")
+    elif not st.session_state.get('gemini_model'):
+        st.error("❌ Gemini model not found in session. Please return to the About AIBC page and click 'Initialize / Update Gemini' in the sidebar.")
     else:
-        # Show results after submission
-        st.success("✅ Test submitted successfully!")
-        st.divider()
-        st.header("📊 Test Results")
-        
-        total_marks = sum(item.get('marks', 0) for item in st.session_state.current_test)
-        
-        # Display student info
-        col1, col2 = st.columns([1, 1])
-        with col1:
-            st.metric("Student Name", st.session_state.student_name)
-        with col2:
-            st.metric("Test File", Path(selected_test).name)
-        
-        st.divider()
+        grading_mode = st.radio(
+            "Grading Method:",
+            ["AI Auto-Grade (Recommended)", "Manual Grading"],
+            horizontal=True
+        )
         
-        # Show answers and correct answers
-        for i, item in enumerate(st.session_state.current_test, 1):
-            with st.expander(f"Question {i} ({item.get('marks', 0)} marks)", expanded=True):
-                st.markdown(f"**Question:** {item.get('question', 'N/A')}")
-                
-                student_ans = st.session_state.student_answers.get(f"q_{i}", "").strip()
-                correct_ans = item.get('answer', 'N/A')
+        if grading_mode == "AI Auto-Grade (Recommended)":
+            if st.button("🤖 Grade with AI", type="primary", use_container_width=True):
+                scores = {}
+                total_earned = 0
+                feedback_list = {}
                 
-                col1, col2 = st.columns([1, 1])
+                with st.spinner("AI is grading the answers..."):
+                    model = st.session_state.gemini_model
+                    pending = {}
+                    for q in st.session_state.qs:
+                        student_answer = st.session_state.student_answers.get(q.idx, "").strip()
+                        # Skip if no answer
+                        if not student_answer:
+                            scores[q.idx] = 0
+                            feedback_list[q.idx] = "No answer provided."
+                        else:
+                            pending[q.idx] = (q, student_answer)
+
+                    # One request per GRADE_BATCH_SIZE answers (a single one for most tests),
+                    # sent together; per-question calls only for what they missed
+                    graded = {}
+                    items = list(pending.items())
+                    chunks = [dict(items[k:k + GRADE_BATCH_SIZE]) for k in range(0, len(items), GRADE_BATCH_SIZE)]
+                    if chunks:
+                        with ThreadPoolExecutor(max_workers=len(chunks)) as ex:
+                            for fut in as_completed([ex.submit(_grade_batch, model, chunk) for chunk in chunks]):
+                                try:
+                                    graded.update(fut.result())
+                                except Exception as e:
+                                    st.warning(f"⚠️ Batch grading failed ({e}); grading those questions individually.")
+                    # Leftovers are independent HTTPS calls: fan them out (worker threads make no st.* calls)
+                    missed = {i: v for i, v in pending.items() if i not in graded}
+                    if missed:
+                        with ThreadPoolExecutor(max_workers=min(8, len(missed))) as ex:
+                            futures = {ex.submit(_grade_one, model, q, answer): i for i, (q, answer) in missed.items()}
+                            for fut in as_completed(futures):
+                                i = futures[fut]
+                                try:
+                                    graded[i] = fut.result()
+                                except Exception as e:
+                                    error_msg = str(e)
+                                    st.warning(f"⚠️ Error grading Q{i}: {error_msg}")
+                                    graded[i] = (0, f"Grading error: {error_msg}")
+                    for i in pending:
+                        awarded_marks, feedback = graded[i]
+                        scores[i] = awarded_marks
+                        feedback_list[i] = feedback
+                        total_earned += awarded_marks
                 
-                with col1:
-                    st.markdown("**Your Answer:**")
-                    if student_ans:
-                        st.info(student_ans)
-                    else:
-                        st.warning("No answer provided")
+                # Store results
+                st.session_state.final_scores = scores
+                st.session_state.total_earned = total_earned
+                st.session_state.ai_feedback = feedback_list
+                # The Final Results block below renders these in this same run
+                st.success("✅ AI grading completed!")
                 
-                with col2:
-                    st.markdown("**Correct Answer:**")
-                    st.success(correct_ans)
-        
-        st.divider()
-        
-        # AI-Powered Grading Section
-        st.header("🤖 AI-Powered Grading")
-        st.markdown(f"**Total Possible Marks:** {total_marks}")
-        
-        # Check if Gemini is initialized
-        if not st.session_state.get('gemini_initialized', False):
-            st.warning("⚠️ Please initialize Gemini AI from the About AIBC landing page first (enter API key in the sidebar and click Initialize).")
-            st.info("💡 Once initialized, you can use AI to automatically grade student answers.")
-        elif not st.session_state.get('gemini_model'):
-            st.error("❌ Gemini model not found in session. Please return to the About AIBC page and click 'Initialize / Update Gemini' in the sidebar.")
         else:
-            grading_mode = st.radio(
-                "Grading Method:",
-                ["AI Auto-Grade (Recommended)", "Manual Grading"],
-                horizontal=True
-            )
+            # Manual grading mode
+            st.markdown("Review the answers above and enter the score for each question:")
+            scores = {}
+            total_earned = 0
             
-            if grading_mode == "AI Auto-Grade (Recommended)":
-                if st.button("🤖 Grade with AI", type="primary", use_container_width=True):
-                    scores = {}
-                    total_earned = 0
-                    feedback_list = {}
-                    
-                    with st.spinner("AI is grading the answers..."):
-                        for i, item in enumerate(st.session_state.current_test, 1):
-                            question_text = item.get('question', '')
-                            correct_answer = item.get('answer', '')
-                            max_marks = item.get('marks', 0)
-                            student_answer = st.session_state.student_answers.get(f"q_{i}", "").strip()
-                            
-                            # Skip if no answer
-                            if not student_answer:
-                                scores[f"q_{i}"] = 0
-                                feedback_list[f"q_{i}"] = "No answer provided."
-                                continue
-                            
-                            # Prepare grading prompt
-                            grading_prompt = f"""You are an expert teacher grading a student's answer. Be fair, constructive, and precise.
-
-Question: {question_text}
-
-Correct/Expected Answer: {correct_answer}
-
-Student's Answer: {student_answer}
-
-Maximum Marks: {max_marks}
-
-Instructions:
-1. Compare the student's answer with the expected answer
-2. Award partial credit for partially correct answers
-3. Consider key concepts, accuracy, and completeness
-4. If the answer is empty or completely wrong, give 0 marks
-5. Provide brief, constructive feedback (1-2 sentences)
-
-Output ONLY in this exact JSON format (no extra text):
-{{"marks": <number between 0 and {max_marks}>, "feedback": "<brief feedback>"}}"""
-                            
-                            try:
-                                response = st.session_state.gemini_model.generate_content(
-                                    grading_prompt,
-                                    generation_config={
-                                        "temperature": 0.3,
-                                        "max_output_tokens": 300,
-                                        "response_mime_type": "text/plain"
-                                    }
-                                )
-                                
-                                # Parse response
-                                response_text = response.text.strip()
-                                
-                                # Remove code fences if present
-                                if '```' in response_text:
-                                    lines = response_text.split('\n')
-                                    response_text = '\n'.join([l for l in lines if not l.strip().startswith('```')])
-                                
-                                # Extract JSON - try multiple approaches
-                                result = None
-                                
-                                # Try 1: Direct JSON parse
-                                try:
-                                    result = json.loads(response_text)
-                                except:
-                                    # Try 2: Extract JSON between braces
-                                    start = response_text.find('{')
-                                    end = response_text.rfind('}') + 1
-                                    if start != -1 and end > start:
-                                        json_str = response_text[start:end]
-                                        try:
-                                            result = json.loads(json_str)
-                                        except:
-                                            pass
-                                
-                                if result and isinstance(result, dict):
-                                    awarded_marks = min(max(0, float(result.get('marks', 0))), max_marks)
-                                    feedback = result.get('feedback', 'Graded by AI')
-                                    
-                                    scores[f"q_{i}"] = awarded_marks
-                                    feedback_list[f"q_{i}"] = feedback
-                                    total_earned += awarded_marks
-                                else:
-                                    # Fallback: try to extract marks from text
-                                    import re
-                                    marks_match = re.search(r'marks["\s:]+(\d+\.?\d*)', response_text, re.IGNORECASE)
-                                    if marks_match:
-                                        awarded_marks = min(max(0, float(marks_match.group(1))), max_marks)
-                                        scores[f"q_{i}"] = awarded_marks
-                                        feedback_list[f"q_{i}"] = response_text[:150]  # Use first 150 chars as feedback
-                                        total_earned += awarded_marks
-                                    else:
-                                        scores[f"q_{i}"] = 0
-                                        feedback_list[f"q_{i}"] = f"Unable to parse AI response. Raw: {response_text[:100]}"
-                                    
-                            except Exception as e:
-                                error_msg = str(e)
-                                st.warning(f"⚠️ Error grading Q{i}: {error_msg}")
-                                scores[f"q_{i}"] = 0
-                                feedback_list[f"q_{i}"] = f"Grading error: {error_msg}"
-                    
-                    # Store results
+            with st.form("scoring_form"):
+                cols = st.columns(3)
+                for q in st.session_state.qs:
+                    col_idx = (q.idx - 1) % 3
+                    with cols[col_idx]:
+                        score = st.number_input(
+                            f"Q{q.idx} (max {q.marks})",
+                            min_value=0,
+                            max_value=q.marks,
+                            value=0,
+                            key=f"score_{q.idx}"
+                        )
+                        scores[q.idx] = score
+                        total_earned += score
+                
+                if st.form_submit_button("Calculate Final Score", type="primary", use_container_width=True):
                     st.session_state.final_scores = scores
                     st.session_state.total_earned = total_earned
-                    st.session_state.ai_feedback = feedback_list
-                    st.success("✅ AI grading completed!")
                     st.rerun()
-                    
+    
+    if 'final_scores' in st.session_state:
+        st.divider()
+        st.header("🎯 Final Results")
+        
+        percentage = (st.session_state.total_earned / total_marks * 100) if total_marks > 0 else 0
+        
+        col1, col2, col3 = st.columns([1, 1, 1])
+        with col1:
+            st.metric("Total Earned", f"{st.session_state.total_earned}/{total_marks}")
+        with col2:
+            st.metric("Percentage", f"{percentage:.1f}%")
+        with col3:
+            if percentage >= 50:
+                st.metric("Status", "✅ Pass", delta="Success")
             else:
-                # Manual grading mode
-                st.markdown("Review the answers above and enter the score for each question:")
-                scores = {}
-                total_earned = 0
-                
-                with st.form("scoring_form"):
-                    cols = st.columns(3)
-                    for i, item in enumerate(st.session_state.current_test, 1):
-                        col_idx = (i - 1) % 3
-                        with cols[col_idx]:
-                            max_marks = item.get('marks', 0)
-                            score = st.number_input(
-                                f"Q{i} (max {max_marks})",
-                                min_value=0,
-                                max_value=max_marks,
-                                value=0,
-                                key=f"score_{i}"
-                            )
-                            scores[f"q_{i}"] = score
-                            total_earned += score
-                    
-                    if st.form_submit_button("Calculate Final Score", type="primary", use_container_width=True):
-                        st.session_state.final_scores = scores
-                        st.session_state.total_earned = total_earned
-                        st.rerun()
+                st.metric("Status", "❌ Fail", delta="Try Again")
         
-        if hasattr(st.session_state, 'final_scores'):
+        # Show AI feedback if available
+        if 'ai_feedback' in st.session_state:
             st.divider()
-            st.header("🎯 Final Results")
-            
-            percentage = (st.session_state.total_earned / total_marks * 100) if total_marks > 0 else 0
-            
-            col1, col2, col3 = st.columns([1, 1, 1])
-            with col1:
-                st.metric("Total Earned", f"{st.session_state.total_earned}/{total_marks}")
-            with col2:
-                st.metric("Percentage", f"{percentage:.1f}%")
-            with col3:
-                if percentage >= 50:
-                    st.metric("Status", "✅ Pass", delta="Success")
-                else:
-                    st.metric("Status", "❌ Fail", delta="Try Again")
-            
-            # Show AI feedback if available
-            if hasattr(st.session_state, 'ai_feedback'):
-                st.divider()
-                st.subheader("📝 AI Feedback for Each Question")
-                for i, item in enumerate(st.session_state.current_test, 1):
-                    score = st.session_state.final_scores.get(f"q_{i}", 0)
-                    max_marks = item.get('marks', 0)
-                    feedback = st.session_state.ai_feedback.get(f"q_{i}", "")
-                    
-                    with st.expander(f"Q{i}: {score}/{max_marks} marks"):
-                        st.markdown(f"**Question:** {item.get('question')}")
-                        st.markdown(f"**Your Score:** {score}/{max_marks}")
-                        if feedback:
-                            st.info(f"**AI Feedback:** {feedback}")
+            st.subheader("📝 AI Feedback for Each Question")
+            for q in st.session_state.qs:
+                score = st.session_state.final_scores.get(q.idx, 0)
+                feedback = st.session_state.ai_feedback.get(q.idx, "")
+                
+                with st.expander(f"Q{q.idx}: {score}/{q.marks} marks"):
+                    st.markdown(f"**Question:** {q.question}")
+                    st.markdown(f"**Your Score:** {score}/{q.marks}")
+                    if feedback:
+                        st.info(f"**AI Feedback:** {feedback}")
+        
+        # Save results option
+        if st.button("Save Results", use_container_width=True):
+            result_data = {
+                "student_name": st.session_state.student_name,
+                "test_file": Path(selected_test).name,
+                "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
+                "total_marks": total_marks,
+                "earned_marks": st.session_state.total_earned,
+                "percentage": round(percentage, 2),
+                "status": "Pass" if percentage >= 50 else "Fail",
+                "questions": []
+            }
             
-            # Save results option
-            if st.button("Save Results", use_container_width=True):
-                result_data = {
-                    "student_name": st.session_state.student_name,
-                    "test_file": Path(selected_test).name,
-                    "date": datetime.now().strftime("%Y-%m-%d %H:%M:%S"),
-                    "total_marks": total_marks,
-                    "earned_marks": st.session_state.total_earned,
-                    "percentage": round(percentage, 2),
-                    "status": "Pass" if percentage >= 50 else "Fail",
-                    "questions": []
+            for q in st.session_state.qs:
+                question_result = {
+                    "question": q.question,
+                    "student_answer": st.session_state.student_answers.get(q.idx, ""),
+                    "correct_answer": q.answer,
+                    "max_marks": q.marks,
+                    "earned_marks": st.session_state.final_scores.get(q.idx, 0)
                 }
                 
-                for i, item in enumerate(st.session_state.current_test, 1):
-                    question_result = {
-                        "question": item.get('question'),
-                        "student_answer": st.session_state.student_answers.get(f"q_{i}", ""),
-                        "correct_answer": item.get('answer'),
-                        "max_marks": item.get('marks'),
-                        "earned_marks": st.session_state.final_scores.get(f"q_{i}", 0)
-                    }
-                    
-                    # Add AI feedback if available
-                    if hasattr(st.session_state, 'ai_feedback'):
-                        question_result["ai_feedback"] = st.session_state.ai_feedback.get(f"q_{i}", "")
-                    
-                    result_data["questions"].append(question_result)
-                
-                # Save to file
-                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-                filename = f"result_{st.session_state.student_name.replace(' ', '_')}_{timestamp}.json"
+                # Add AI feedback if available
+                if 'ai_feedback' in st.session_state:
+                    question_result["ai_feedback"] = st.session_state.ai_feedback.get(q.idx, "")
                 
-                try:
-                    file_path = DATA_DIR / filename
-                    with open(file_path, 'w', encoding='utf-8') as f:
-                        json.dump(result_data, f, indent=4)
-                    st.success(f"✅ Results saved to data/{filename}")
-                except Exception as e:
-                    st.error(f"❌ Error saving results: {e}")
-        
-        # Reset button
-        st.divider()
-        col1, col2 = st.columns([1, 1])
-        with col1:
-            if st.button("Take Another Test", use_container_width=True):
-                st.session_state.current_test = None
-                st.session_state.student_answers = {}
-                st.session_state.test_submitted = False
-                if hasattr(st.session_state, 'final_scores'):
-                    delattr(st.session_state, 'final_scores')
-                if hasattr(st.session_state, 'total_earned'):
-                    delattr(st.session_state, 'total_earned')
-                if hasattr(st.session_state, 'ai_feedback'):
-                    delattr(st.session_state, 'ai_feedback')
-                st.rerun()
-        with col2:
-            if st.button("Keep Answers & Take New Test", use_container_width=True, type="secondary"):
-                # Keep answer history but clear current test
-                st.session_state.current_test = None
-                st.session_state.student_answers = {}
-                st.session_state.test_submitted = False
-                if hasattr(st.session_state, 'final_scores'):
-                    delattr(st.session_state, 'final_scores')
-                if hasattr(st.session_state, 'total_earned'):
-                    delattr(st.session_state, 'total_earned')
-                if hasattr(st.session_state, 'ai_feedback'):
-                    delattr(st.session_state, 'ai_feedback')
-                st.info("📚 Your answer history has been preserved!")
-                st.rerun()
+                result_data["questions"].append(question_result)
+            
+            # Save to file
+            timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+            filename = f"result_{st.session_state.student_name.replace(' ', '_')}_{timestamp}.json"
+            
+            try:
+                file_path = DATA_DIR / filename
+                file_path.write_bytes(json_utils.dumps(result_data, indent=True))
+                st.success(f"✅ Results saved to data/{filename}")
+            except Exception as e:
+                st.error(f"❌ Error saving results: {e}")
+    
+    # Reset button
+    st.divider()
+    col1, col2 = st.columns([1, 1])
+    with col1:
+        if st.button("Take Another Test", use_container_width=True):
+            st.session_state.current_test = None
+            st.session_state.student_answers = {}
+            st.session_state.test_submitted = False
+            st.session_state.pop('final_scores', None)
+            st.session_state.pop('total_earned', None)
+            st.session_state.pop('ai_feedback', None)
+            st.rerun()
+    with col2:
+        if st.button("Keep Answers & Take New Test", use_container_width=True, type="secondary"):
+            # Keep answer history but clear current test
+            st.session_state.current_test = None
+            st.session_state.student_answers = {}
+            st.session_state.test_submitted = False
+            st.session_state.pop('final_scores', None)
+            st.session_state.pop('total_earned', None)
+            st.session_state.pop('ai_feedback', None)
+            st.info("📚 Your answer history has been preserved!")
+            st.rerun()
+
+# Display test if loaded: only the path for the current state runs
+if st.session_state.current_test:
+    st.divider()
+    st.header("📝 Answer the Questions")
+    if st.session_state.test_submitted:
+        _render_results()
+    else:
+        _render_form()
 
 # Footer
 st.divider()
@@ -1,17 +1,17 @@
 # -*- coding: utf-8 -*-
 """Student Analytics & Visualizations"""
 
+import os
 import streamlit as st
-import json
-import glob
 from pathlib import Path
 DATA_DIR = Path(__file__).resolve().parent.parent / "data"
 DATA_DIR.mkdir(exist_ok=True)
+import numpy as np
 import pandas as pd
-import plotly.express as px
-import plotly.graph_objects as go
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor
 from helper_functions.utility import check_password
+from helper_functions import json_utils
 
 # Page configuration
 st.set_page_config(
@@ -28,67 +28,109 @@ st.title("📊 Student Analytics Dashboard")
 st.markdown("Analyze student performance with interactive visualizations")
 
 # Load all result files
-result_files = glob.glob(str(DATA_DIR / "result_*.json"))
+def _scan_results():
+    """Result file paths and their ((path, mtime_ns, size), ...) cache signature from one directory read"""
+    sig = []
+    with os.scandir(DATA_DIR) as it:
+        for e in it:
+            if e.name.startswith('result_') and e.name.endswith('.json') and e.is_file():
+                stat = e.stat()
+                sig.append((e.path, stat.st_mtime_ns, stat.st_size))
+    sig.sort()
+    return [p for p, _, _ in sig], tuple(sig)
+
+result_files, sig = _scan_results()
 
 if not result_files:
     st.warning("⚠️ No student results found. Students need to complete tests first.")
     st.info("💡 Results are automatically saved when tests are graded on the Student Test page.")
     st.stop()
 
-# Load all results into a list
-all_results = []
-for file in result_files:
+def _read_result(path: str):
     try:
-        with open(file, 'r', encoding='utf-8') as f:
-            data = json.load(f)
-            from pathlib import Path as _P
-            data['filename'] = _P(file).name
-            all_results.append(data)
+        data = json_utils.loads(Path(path).read_bytes())
+        data['filename'] = Path(path).name
+        return data, None
     except Exception as e:
-        st.warning(f"⚠️ Could not load {file}: {e}")
+        return None, e
+
+@st.cache_data(show_spinner=False)
+def _load_all_results(signature: tuple):
+    """Parse every result file and build the summary frame; signature is ((path, mtime_ns, size), ...)
+    so the cache only misses when a file is added, replaced or removed. Returns (results, df, errors)."""
+    all_results, errors = [], []
+    paths = [p for p, _, _ in signature]
+    # Many small files: overlap the reads on threads (no st.* calls in _read_result)
+    with ThreadPoolExecutor(max_workers=min(32, len(paths) or 1)) as ex:
+        for file, (data, err) in zip(paths, ex.map(_read_result, paths)):
+            if err is None:
+                all_results.append(data)
+            else:
+                errors.append(f"⚠️ Could not load {file}: {err}")
+
+    # Convert to DataFrame for easier analysis: one list per column, dtypes set up front
+    fields = {
+        'Student Name': 'student_name',
+        'Test File': 'test_file',
+        'Date': 'date',
+        'Total Marks': 'total_marks',
+        'Earned Marks': 'earned_marks',
+        'Percentage': 'percentage',
+        'Status': 'status',
+        'Filename': 'filename',
+    }
+    df = pd.DataFrame({col: [r[key] for r in all_results] for col, key in fields.items()})
+    # Parse once here with the Student Test writer's format instead of on every Performance Over Time rerun
+    df['Date'] = pd.to_datetime(df['Date'], format='%Y-%m-%d %H:%M:%S', errors='coerce')
+    # Earned marks can be fractional under AI grading, so float rather than int
+    df = df.astype({
+        'Student Name': 'category',
+        'Test File': 'category',
+        'Status': 'category',
+        'Total Marks': 'int32',
+        'Earned Marks': 'float32',
+        'Percentage': 'float32',
+    })
+    return all_results, df, errors
+
+# Load all results into a list; keep them in the session until the files change, so reruns
+# reuse the same frame instead of unpickling a fresh copy from the cache
+if st.session_state.get('results_sig') != sig:
+    st.session_state.results = _load_all_results(sig)
+    st.session_state.results_sig = sig
+all_results, df_students, load_errors = st.session_state.results
+for msg in load_errors:
+    st.warning(msg)
 
 if not all_results:
     st.error("❌ No valid result files found.")
     st.stop()
 
-# Convert to DataFrame for easier analysis
-df_students = pd.DataFrame([
-    {
-        'Student Name': r['student_name'],
-        'Test File': r['test_file'],
-        'Date': r['date'],
-        'Total Marks': r['total_marks'],
-        'Earned Marks': r['earned_marks'],
-        'Percentage': r['percentage'],
-        'Status': r['status'],
-        'Filename': r['filename']
-    }
-    for r in all_results
-])
-
 # Sidebar filters
 st.sidebar.header("🔍 Filters")
 
 # Student filter
-all_students = ['All Students'] + sorted(df_students['Student Name'].unique().tolist())
+# Categories from astype('category') are the distinct values, already sorted
+all_students = ['All Students'] + df_students['Student Name'].cat.categories.tolist()
 selected_student = st.sidebar.selectbox("Select Student:", all_students)
 
 # Test filter
-all_tests = ['All Tests'] + sorted(df_students['Test File'].unique().tolist())
+all_tests = ['All Tests'] + df_students['Test File'].cat.categories.tolist()
 selected_test = st.sidebar.selectbox("Select Test:", all_tests)
 
 # Status filter
 status_options = ['All', 'Pass', 'Fail']
 selected_status = st.sidebar.selectbox("Status:", status_options)
 
-# Apply filters
-filtered_df = df_students.copy()
+# Apply filters: combine into one mask and slice once
+mask = np.ones(len(df_students), dtype=bool)
 if selected_student != 'All Students':
-    filtered_df = filtered_df[filtered_df['Student Name'] == selected_student]
+    mask &= (df_students['Student Name'] == selected_student).to_numpy()
 if selected_test != 'All Tests':
-    filtered_df = filtered_df[filtered_df['Test File'] == selected_test]
+    mask &= (df_students['Test File'] == selected_test).to_numpy()
 if selected_status != 'All':
-    filtered_df = filtered_df[filtered_df['Status'] == selected_status]
+    mask &= (df_students['Status'] == selected_status).to_numpy()
+filtered_df = df_students[mask]
 
 # Summary metrics
 st.header("📈 Overview")
@@ -99,11 +141,13 @@ with col1:
 with col2:
     avg_percentage = filtered_df['Percentage'].mean() if len(filtered_df) > 0 else 0
     st.metric("Average Score", f"{avg_percentage:.1f}%")
+# Count on the status column directly rather than slicing the frame twice
+status = filtered_df['Status']
+pass_count = int((status == 'Pass').to_numpy().sum())
+fail_count = len(status) - pass_count
 with col3:
-    pass_count = len(filtered_df[filtered_df['Status'] == 'Pass'])
     st.metric("Tests Passed", pass_count)
 with col4:
-    fail_count = len(filtered_df[filtered_df['Status'] == 'Fail'])
     st.metric("Tests Failed", fail_count)
 
 st.divider()
@@ -125,12 +169,17 @@ viz_type = st.selectbox(
 
 st.divider()
 
-# Visualizations
-if viz_type == "Score Distribution":
-    st.subheader("📊 Score Distribution")
-    
+# Figure builders: cached on the (hashed) input frame, so reruns with unchanged filters skip Plotly construction.
+# cache_resource hands back the built Figure itself; cache_data would unpickle, and so re-validate, a copy on
+# every hit. The figures are never mutated after they are returned.
+# Plotly is imported inside the builders, so page loads that never draw a chart skip its import cost.
+FIGURE_CACHE_ENTRIES = 32
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _score_distribution_figs(df: pd.DataFrame):
+    import plotly.express as px
     fig = px.histogram(
-        filtered_df,
+        df,
         x='Percentage',
         nbins=20,
         title='Distribution of Test Scores (%)',
@@ -139,27 +188,17 @@ if viz_type == "Score Distribution":
     )
     fig.add_vline(x=50, line_dash="dash", line_color="red", annotation_text="Pass Threshold (50%)")
     fig.update_layout(showlegend=False)
-    st.plotly_chart(fig, use_container_width=True)
-    
-    # Box plot
     fig2 = px.box(
-        filtered_df,
+        df,
         y='Percentage',
         title='Score Statistics',
         labels={'Percentage': 'Score (%)'}
     )
-    st.plotly_chart(fig2, use_container_width=True)
+    return fig, fig2
 
-elif viz_type == "Student Performance Comparison":
-    st.subheader("👥 Student Performance Comparison")
-    
-    student_avg = df_students.groupby('Student Name').agg({
-        'Percentage': 'mean',
-        'Status': lambda x: (x == 'Pass').sum()
-    }).reset_index()
-    student_avg.columns = ['Student Name', 'Average Score (%)', 'Tests Passed']
-    student_avg = student_avg.sort_values('Average Score (%)', ascending=False)
-    
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _student_comparison_fig(student_avg: pd.DataFrame):
+    import plotly.express as px
     fig = px.bar(
         student_avg,
         x='Student Name',
@@ -171,8 +210,150 @@ elif viz_type == "Student Performance Comparison":
     )
     fig.update_traces(texttemplate='%{text:.1f}%', textposition='outside')
     fig.add_hline(y=50, line_dash="dash", line_color="red", annotation_text="Pass Threshold")
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _pass_fail_pie(status_counts: pd.Series):
+    import plotly.express as px
+    return px.pie(
+        values=status_counts.values,
+        names=status_counts.index,
+        title='Overall Pass/Fail Rate',
+        color=status_counts.index,
+        color_discrete_map={'Pass': '#00CC96', 'Fail': '#EF553B'}
+    )
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _pass_fail_by_student_fig(student_status: pd.DataFrame):
+    import plotly.express as px
+    return px.bar(
+        student_status,
+        x='Student Name',
+        y='Count',
+        color='Status',
+        title='Pass/Fail by Student',
+        barmode='group',
+        color_discrete_map={'Pass': '#00CC96', 'Fail': '#EF553B'}
+    )
+
+# Largest-Triangle-Three-Buckets: per-student traces longer than this are thinned before plotting
+LTTB_POINTS = 500
+
+def _lttb_indices(x: np.ndarray, y: np.ndarray, n: int) -> np.ndarray:
+    """Indices of n points (first and last always kept) that preserve the visual shape of (x, y)"""
+    size = len(x)
+    if n >= size or n < 3:
+        return np.arange(size)
+    keep = np.empty(n, dtype=np.int64)
+    keep[0], keep[-1] = 0, size - 1
+    # n-2 buckets over the interior points; each keeps the point forming the largest
+    # triangle with the previous pick and the mean of the next bucket
+    edges = np.linspace(1, size - 1, n - 1).astype(np.int64)
+    a = 0
+    for i in range(n - 2):
+        lo, hi = edges[i], edges[i + 1]
+        if i + 2 < n - 1:
+            avg_x, avg_y = x[hi:edges[i + 2]].mean(), y[hi:edges[i + 2]].mean()
+        else:
+            avg_x, avg_y = x[-1], y[-1]
+        area = np.abs((x[a] - avg_x) * (y[lo:hi] - y[a]) - (x[a] - x[lo:hi]) * (avg_y - y[a]))
+        a = lo + int(area.argmax())
+        keep[i + 1] = a
+    return keep
+
+def _downsample(df: pd.DataFrame, n: int = LTTB_POINTS) -> pd.DataFrame:
+    parts = []
+    for _, g in df.groupby('Student Name', observed=True, sort=False):
+        if len(g) > n:
+            g = g.dropna(subset=['Date'])
+            x = g['Date'].to_numpy().astype('int64').astype('float64')
+            g = g.iloc[_lttb_indices(x, g['Percentage'].to_numpy(dtype='float64'), n)]
+        parts.append(g)
+    return pd.concat(parts) if parts else df
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _over_time_fig(df: pd.DataFrame):
+    import plotly.express as px
+    df = _downsample(df)
+    fig = px.line(
+        df,
+        x='Date',
+        y='Percentage',
+        color='Student Name',
+        title='Score Trends Over Time',
+        markers=True,
+        labels={'Percentage': 'Score (%)'},
+        render_mode='webgl'
+    )
+    fig.add_hline(y=50, line_dash="dash", line_color="red", annotation_text="Pass Threshold")
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _difficulty_fig(test_stats: pd.DataFrame):
+    import plotly.graph_objects as go
+    fig = go.Figure()
+    fig.add_trace(go.Bar(
+        x=test_stats['Test File'].to_numpy(),
+        y=test_stats['Avg Score'].to_numpy(),
+        name='Average Score',
+        error_y=dict(type='data', array=test_stats['Std Dev'].to_numpy()),
+        marker_color='lightblue'
+    ))
+    fig.add_hline(y=50, line_dash="dash", line_color="red", annotation_text="Pass Threshold")
+    fig.update_layout(
+        title='Test Difficulty (Lower avg = Harder)',
+        xaxis_title='Test File',
+        yaxis_title='Average Score (%)',
+        showlegend=False
+    )
+    return fig
+
+@st.cache_resource(show_spinner=False, max_entries=FIGURE_CACHE_ENTRIES)
+def _question_fig(df_questions: pd.DataFrame):
+    import plotly.express as px
+    fig = px.bar(
+        df_questions,
+        x='Question #',
+        y='Score %',
+        title='Score by Question',
+        color='Score %',
+        color_continuous_scale='RdYlGn',
+        range_color=[0, 100]
+    )
+    fig.add_hline(y=50, line_dash="dash", line_color="red")
+    return fig
+
+def _contiguous_float32(df: pd.DataFrame, cols) -> pd.DataFrame:
+    """Groupby output can come back as a Fortran-ordered block; give each numeric column its own C-contiguous float32 array"""
+    for c in cols:
+        df[c] = np.ascontiguousarray(df[c].to_numpy(dtype=np.float32))
+    return df
+
+# Visualizations
+if viz_type == "Score Distribution":
+    st.subheader("📊 Score Distribution")
+    
+    fig, fig2 = _score_distribution_figs(filtered_df)
     st.plotly_chart(fig, use_container_width=True)
     
+    # Box plot
+    st.plotly_chart(fig2, use_container_width=True)
+
+elif viz_type == "Student Performance Comparison":
+    st.subheader("👥 Student Performance Comparison")
+    
+    # Named aggregation over an int8 pass flag keeps both columns on the vectorised path (no per-group lambda)
+    student_avg = (
+        df_students.assign(_pass=(df_students['Status'] == 'Pass').astype('int8'))
+        .groupby('Student Name', observed=True, sort=False)
+        .agg(**{'Average Score (%)': ('Percentage', 'mean'), 'Tests Passed': ('_pass', 'sum')})
+        .reset_index()
+    )
+    student_avg = _contiguous_float32(student_avg, ['Average Score (%)'])
+    student_avg = student_avg.sort_values('Average Score (%)', ascending=False)
+    
+    st.plotly_chart(_student_comparison_fig(student_avg), use_container_width=True)
+    
     # Show detailed table
     st.dataframe(student_avg, use_container_width=True)
 
@@ -183,52 +364,23 @@ elif viz_type == "Pass/Fail Rate":
     
     with col1:
         # Overall pie chart
-        status_counts = filtered_df['Status'].value_counts()
-        fig = px.pie(
-            values=status_counts.values,
-            names=status_counts.index,
-            title='Overall Pass/Fail Rate',
-            color=status_counts.index,
-            color_discrete_map={'Pass': '#00CC96', 'Fail': '#EF553B'}
-        )
-        st.plotly_chart(fig, use_container_width=True)
+        st.plotly_chart(_pass_fail_pie(filtered_df['Status'].value_counts()), use_container_width=True)
     
     with col2:
         # By student
-        student_status = df_students.groupby(['Student Name', 'Status']).size().reset_index(name='Count')
-        fig2 = px.bar(
-            student_status,
-            x='Student Name',
-            y='Count',
-            color='Status',
-            title='Pass/Fail by Student',
-            barmode='group',
-            color_discrete_map={'Pass': '#00CC96', 'Fail': '#EF553B'}
-        )
-        st.plotly_chart(fig2, use_container_width=True)
+        student_status = df_students.groupby(['Student Name', 'Status'], observed=True).size().reset_index(name='Count')
+        st.plotly_chart(_pass_fail_by_student_fig(student_status), use_container_width=True)
 
 elif viz_type == "Performance Over Time":
     st.subheader("📅 Performance Over Time")
     
-    # Convert date strings to datetime
-    filtered_df['DateTime'] = pd.to_datetime(filtered_df['Date'])
-    filtered_df = filtered_df.sort_values('DateTime')
+    filtered_df = filtered_df.sort_values('Date')
     
-    fig = px.line(
-        filtered_df,
-        x='DateTime',
-        y='Percentage',
-        color='Student Name',
-        title='Score Trends Over Time',
-        markers=True,
-        labels={'DateTime': 'Date', 'Percentage': 'Score (%)'}
-    )
-    fig.add_hline(y=50, line_dash="dash", line_color="red", annotation_text="Pass Threshold")
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(_over_time_fig(filtered_df), use_container_width=True)
     
     # Show improvement/decline
     if selected_student != 'All Students':
-        student_data = filtered_df[filtered_df['Student Name'] == selected_student].sort_values('DateTime')
+        student_data = filtered_df[filtered_df['Student Name'] == selected_student].sort_values('Date')
         if len(student_data) > 1:
             first_score = student_data.iloc[0]['Percentage']
             last_score = student_data.iloc[-1]['Percentage']
@@ -245,29 +397,24 @@ elif viz_type == "Performance Over Time":
 elif viz_type == "Test Difficulty Analysis":
     st.subheader("🎯 Test Difficulty Analysis")
     
-    test_stats = df_students.groupby('Test File').agg({
-        'Percentage': ['mean', 'min', 'max', 'std'],
-        'Status': lambda x: (x == 'Pass').sum() / len(x) * 100
-    }).reset_index()
-    test_stats.columns = ['Test File', 'Avg Score', 'Min Score', 'Max Score', 'Std Dev', 'Pass Rate']
+    # Pass rate is the mean of a 0/1 flag, so every aggregate runs in pandas' kernels (no per-group lambda)
+    test_stats = (
+        df_students.assign(_pass=(df_students['Status'] == 'Pass').astype('float32'))
+        .groupby('Test File', observed=True, sort=False)
+        .agg(**{
+            'Avg Score': ('Percentage', 'mean'),
+            'Min Score': ('Percentage', 'min'),
+            'Max Score': ('Percentage', 'max'),
+            'Std Dev': ('Percentage', 'std'),
+            'Pass Rate': ('_pass', 'mean'),
+        })
+        .reset_index()
+    )
+    test_stats['Pass Rate'] *= 100.0
+    test_stats = _contiguous_float32(test_stats, ['Avg Score', 'Min Score', 'Max Score', 'Std Dev', 'Pass Rate'])
     test_stats = test_stats.sort_values('Avg Score')
     
-    fig = go.Figure()
-    fig.add_trace(go.Bar(
-        x=test_stats['Test File'],
-        y=test_stats['Avg Score'],
-        name='Average Score',
-        error_y=dict(type='data', array=test_stats['Std Dev']),
-        marker_color='lightblue'
-    ))
-    fig.add_hline(y=50, line_dash="dash", line_color="red", annotation_text="Pass Threshold")
-    fig.update_layout(
-        title='Test Difficulty (Lower avg = Harder)',
-        xaxis_title='Test File',
-        yaxis_title='Average Score (%)',
-        showlegend=False
-    )
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(_difficulty_fig(test_stats), use_container_width=True)
     
     st.dataframe(test_stats.round(2), use_container_width=True)
 
@@ -275,50 +422,54 @@ elif viz_type == "Question-Level Analysis":
     st.subheader("❓ Question-Level Analysis")
     
     # Select a specific result to analyze
-    selected_result = st.selectbox(
+    labels = [f"{r['student_name']} - {r['test_file']} - {r['date']}" for r in all_results]
+    result_idx = st.selectbox(
         "Select a test result to analyze:",
-        [f"{r['student_name']} - {r['test_file']} - {r['date']}" for r in all_results]
+        range(len(labels)),
+        format_func=labels.__getitem__
     )
-    
-    result_idx = [f"{r['student_name']} - {r['test_file']} - {r['date']}" for r in all_results].index(selected_result)
     result_data = all_results[result_idx]
     
-    # Create question-level dataframe
-    questions_data = []
-    for i, q in enumerate(result_data['questions'], 1):
-        questions_data.append({
-            'Question #': i,
-            'Question': q['question'][:50] + '...' if len(q['question']) > 50 else q['question'],
-            'Max Marks': q['max_marks'],
-            'Earned Marks': q['earned_marks'],
-            'Score %': (q['earned_marks'] / q['max_marks'] * 100) if q['max_marks'] > 0 else 0
-        })
-    
-    df_questions = pd.DataFrame(questions_data)
+    # Create question-level dataframe from column arrays; one vectorised division for the scores
+    qs = result_data['questions']
+    earned = np.fromiter((q['earned_marks'] for q in qs), dtype=np.float32, count=len(qs))
+    max_marks = np.fromiter((q['max_marks'] for q in qs), dtype=np.float32, count=len(qs))
+    pct = np.divide(earned * 100, max_marks, out=np.zeros_like(earned), where=max_marks > 0)
+    df_questions = pd.DataFrame({
+        'Question #': np.arange(1, len(qs) + 1, dtype='int32'),
+        'Question': [q['question'][:50] + '...' if len(q['question']) > 50 else q['question'] for q in qs],
+        'Max Marks': max_marks,
+        'Earned Marks': earned,
+        'Score %': pct,
+    })
     
     # Bar chart
-    fig = px.bar(
-        df_questions,
-        x='Question #',
-        y='Score %',
-        title='Score by Question',
-        color='Score %',
-        color_continuous_scale='RdYlGn',
-        range_color=[0, 100]
-    )
-    fig.add_hline(y=50, line_dash="dash", line_color="red")
-    st.plotly_chart(fig, use_container_width=True)
+    st.plotly_chart(_question_fig(df_questions), use_container_width=True)
     
     # Detailed table
     st.dataframe(df_questions, use_container_width=True)
     
     # Show questions with lowest scores
-    lowest_scores = df_questions.nsmallest(3, 'Score %')
+    # Stable sort: tied scores (0% / 100% are common) keep question order, as nsmallest(keep='first') did
+    lowest_scores = df_questions.iloc[np.argsort(pct, kind='stable')[:3]]
     if len(lowest_scores) > 0:
         st.subheader("📉 Questions Needing Review")
         for _, row in lowest_scores.iterrows():
             st.warning(f"**Q{row['Question #']}** ({row['Score %']:.0f}%): {row['Question']}")
 
+@st.cache_data(show_spinner=False)
+def _csv_bytes(df: pd.DataFrame) -> bytes:
+    """CSV for the download; Arrow's C++ writer when pyarrow is installed, pandas' otherwise"""
+    try:
+        import pyarrow as pa
+        import pyarrow.csv as pacsv
+    except ImportError:
+        return df.to_csv(index=False).encode('utf-8')
+    buf = pa.BufferOutputStream()
+    # Second resolution keeps timestamps as 2024-01-01 10:00:00 rather than with a .000000 suffix
+    pacsv.write_csv(pa.Table.from_pandas(df.astype({'Date': 'datetime64[s]'}), preserve_index=False), buf)
+    return buf.getvalue().to_pybytes()
+
 # Raw data view
 st.divider()
 st.header("📋 Detailed Records")
@@ -327,10 +478,9 @@ if st.checkbox("Show Raw Data"):
     st.dataframe(filtered_df, use_container_width=True)
     
     # Download option
-    csv = filtered_df.to_csv(index=False)
     st.download_button(
         label="📥 Download Data as CSV",
-        data=csv,
+        data=_csv_bytes(filtered_df),
         file_name=f"student_results_{datetime.now().strftime('%Y%m%d_%H%M%S')}.csv",
         mime="text/csv"
     )
@@ -354,21 +504,24 @@ with col1:
         }
         
         filename = f"analytics_report_{datetime.now().strftime('%Y%m%d_%H%M%S')}.json"
-        with open(DATA_DIR / filename, 'w', encoding='utf-8') as f:
-            json.dump(report_data, f, indent=4)
+        (DATA_DIR / filename).write_bytes(json_utils.dumps(report_data, indent=True))
         st.success(f"✅ Report saved to data/{filename}")
 
 with col2:
-    if st.button("🗑️ Clear All Results", use_container_width=True, type="secondary"):
-        if st.checkbox("⚠️ Confirm deletion of all result files"):
-            import os
-            for file in result_files:
-                try:
-                    os.remove(file)
-                except:
-                    pass
-            st.success("✅ All result files deleted!")
-            st.rerun()
+    # The confirmation has to exist before the click: a checkbox created inside the button
+    # branch disappears on the rerun its own click triggers, so deletion could never happen
+    confirmed = st.checkbox("⚠️ Confirm deletion of all result files")
+    if st.button("🗑️ Clear All Results", use_container_width=True, type="secondary", disabled=not confirmed):
+        for file in result_files:
+            try:
+                os.unlink(file)
+            except OSError:
+                pass
+        _load_all_results.clear()
+        st.session_state.pop('results', None)
+        st.session_state.pop('results_sig', None)
+        st.toast("✅ All result files deleted!")
+        st.rerun()
 
 # Footer
 st.divider()